@@ -9,74 +9,391 @@ Returns a dict with:
 """
 
 import os
-import json
+import re
+import time
+import asyncio
+
+import httpx
+import orjson
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import (
+    APIConnectionError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+
+from app.cache import SemanticCache
+from app.classifier import classify
+from app.prompts import SYSTEM_PROMPT
 
 load_dotenv()
 
+MODEL = "gpt-4.1-mini"
+FAST_MODEL = "gpt-4.1-nano"  # summary + reply once the classifier has labeled the ticket
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# One client per process so the HTTPS connection is kept alive across tickets.
+# The sync client is only for scripts (batch worker, classifier build).
+# Missing key is reported on first use, so the API itself can still start.
+_API_KEY = os.getenv("OPENAI_API_KEY")
+_CLIENT = OpenAI(api_key=_API_KEY, timeout=30.0, max_retries=2) if _API_KEY else None
+_ACLIENT = (
+    AsyncOpenAI(
+        api_key=_API_KEY,
+        timeout=30.0,
+        max_retries=0,  # chat calls retry in _create, within the rate budget
+        http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(max_connections=100)),
+    )
+    if _API_KEY
+    else None
+)
+
+# Structured Outputs (JSON Schema) — πιο αξιόπιστο από “Return ONLY JSON”
+_SCHEMA = {
+    "name": "ticket_analysis",
+    "schema": {
+        "type": "object",
+        "additionalProperties": False,
+        "properties": {
+            "priority": {"type": "string", "enum": ["low", "medium", "high"]},
+            "category": {"type": "string", "enum": ["billing", "technical", "account", "other"]},
+            "summary": {"type": "string"},
+            "suggested_reply": {"type": "string"},
+        },
+        "required": ["priority", "category", "summary", "suggested_reply"],
+    },
+    "strict": True,
+}
+_RESPONSE_FORMAT = {"type": "json_schema", "json_schema": _SCHEMA}
+
+# Static prefix first, ticket last: keeps the prompt cacheable by OpenAI.
+_SYSTEM_MSG = {
+    "role": "system",
+    "content": SYSTEM_PROMPT,
+}
+
+# Second stage when classify() already set priority and category
+_REPLY_SCHEMA = {
+    "name": "ticket_reply",
+    "schema": {
+        "type": "object",
+        "additionalProperties": False,
+        "properties": {
+            "summary": {"type": "string"},
+            "suggested_reply": {"type": "string"},
+        },
+        "required": ["summary", "suggested_reply"],
+    },
+    "strict": True,
+}
+_REPLY_FORMAT = {"type": "json_schema", "json_schema": _REPLY_SCHEMA}
+
+_FALLBACK_INSTRUCTION = {
+    "role": "user",
+    "content": "Return ONLY a valid JSON object with keys: priority, category, summary, suggested_reply.",
+}
+
 
-def analyze_ticket(subject: str, body: str) -> dict:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+def _require(client):
+    if client is None:
         raise RuntimeError(
             "OPENAI_API_KEY is missing. Ensure .env exists in project root and contains OPENAI_API_KEY=..."
         )
+    return client
 
-    client = OpenAI(api_key=api_key)
-
-    # Structured Outputs (JSON Schema) — πιο αξιόπιστο από “Return ONLY JSON”
-    schema = {
-        "name": "ticket_analysis",
-        "schema": {
-            "type": "object",
-            "additionalProperties": False,
-            "properties": {
-                "priority": {"type": "string", "enum": ["low", "medium", "high"]},
-                "category": {"type": "string", "enum": ["billing", "technical", "account", "other"]},
-                "summary": {"type": "string"},
-                "suggested_reply": {"type": "string"},
-            },
-            "required": ["priority", "category", "summary", "suggested_reply"],
-        },
-        "strict": True,
-    }
 
-    messages = [
+# ---- throttling (shared by every OpenAI chat call in this process) ----
+
+# Per process: with N uvicorn workers the account-wide totals are N times these.
+MAX_REQUESTS_PER_MINUTE = 500
+MAX_TOKENS_PER_MINUTE = 200_000
+MAX_ATTEMPTS = 3
+BULK_CONCURRENCY = 10
+
+# Retried here with backoff; the client itself is built with max_retries=0
+_TRANSIENT_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+
+class _MinuteBudget:
+    """
+    Requests/tokens allowed per minute; counters reset every minute.
+    """
+
+    def __init__(self, max_requests: int, max_tokens: int):
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        self._lock = asyncio.Lock()
+        self._window_start = time.monotonic()
+        self._requests = 0
+        self._tokens = 0
+
+    async def acquire(self, tokens: int) -> None:
+        async with self._lock:
+            while True:
+                elapsed = time.monotonic() - self._window_start
+                if elapsed >= 60:
+                    self._window_start = time.monotonic()
+                    self._requests = 0
+                    self._tokens = 0
+                    elapsed = 0
+
+                fits = (
+                    self._requests + 1 <= self.max_requests
+                    and self._tokens + tokens <= self.max_tokens
+                )
+                if fits or self._requests == 0:
+                    self._requests += 1
+                    self._tokens += tokens
+                    return
+
+                await asyncio.sleep(60 - elapsed)
+
+
+_budget = _MinuteBudget(MAX_REQUESTS_PER_MINUTE, MAX_TOKENS_PER_MINUTE)
+_bulk_semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+
+
+def _estimate_tokens(messages: list) -> int:
+    # ~4 chars per token for the prompt, plus room for the JSON answer
+    return sum(len(m["content"]) for m in messages) // 4 + 300
+
+
+async def _create(**kwargs):
+    """
+    Chat completion counted against the shared budget. Transient errors
+    are retried with exponential backoff; each attempt is budgeted.
+    """
+    client = _require(_ACLIENT)
+    tokens = _estimate_tokens(kwargs["messages"])
+
+    for attempt in range(MAX_ATTEMPTS):
+        await _budget.acquire(tokens)
+        try:
+            return await client.chat.completions.create(**kwargs)
+        except _TRANSIENT_ERRORS:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(2 ** attempt)
+
+
+# Repeated tickets ("reset password", "refund") skip the LLM call entirely.
+_cache = SemanticCache(max_distance=0.1)
+
+
+async def _aembed(text: str) -> list[float]:
+    resp = await _require(_ACLIENT).embeddings.create(model=EMBEDDING_MODEL, input=text)
+    return resp.data[0].embedding
+
+
+def get_client() -> OpenAI:
+    return _require(_CLIENT)
+
+
+def _log_usage(resp) -> None:
+    usage = resp.usage
+    if usage is None:
+        return
+
+    details = usage.prompt_tokens_details
+    cached = (details.cached_tokens or 0) if details else 0
+    print(f"OpenAI usage: prompt_tokens={usage.prompt_tokens} cached_tokens={cached}")
+
+
+def _build_messages(subject: str, body: str) -> list:
+    return [
+        _SYSTEM_MSG,
         {
-            "role": "system",
-            "content": "You are a helpful customer support assistant. Return structured results.",
+            "role": "user",
+            "content": f"Ticket subject: {subject}\nTicket body: {body}",
         },
+    ]
+
+
+def _build_reply_messages(subject: str, body: str, labels: dict) -> list:
+    return [
+        *_build_messages(subject, body),
         {
             "role": "user",
-            "content": f"Ticket subject: {subject}\nTicket body: {body}",
+            "content": (
+                f"Priority ({labels['priority']}) and category ({labels['category']}) are already set. "
+                "Return only summary and suggested_reply."
+            ),
         },
     ]
 
+
+def build_chat_body(subject: str, body: str) -> dict:
+    """
+    Chat Completions request body for one ticket (Batch API input line).
+    """
+    return {
+        "model": MODEL,
+        "messages": _build_messages(subject, body),
+        "temperature": 0.2,
+        "response_format": _RESPONSE_FORMAT,
+    }
+
+
+def _is_complete(result: dict) -> bool:
+    """
+    All four fields present, enums within the schema. JSON-mode answers
+    aren't checked by the API, so only complete ones are worth caching.
+    """
+    for field, spec in _SCHEMA["schema"]["properties"].items():
+        value = result.get(field)
+        if not isinstance(value, str) or value not in spec.get("enum", (value,)):
+            return False
+    return True
+
+
+async def _complete_fields(**kwargs):
+    """
+    One non-streamed chat completion, as (field, value) pairs.
+    """
+    resp = await _create(**kwargs)
+    _log_usage(resp)
+    for item in orjson.loads(resp.choices[0].message.content).items():
+        yield item
+
+
+async def _cascade(subject: str, body: str, embedding, fields):
+    """
+    (field, value) pairs from the classifier cascade, shared by the plain
+    and streamed analysis. `fields(**request)` runs one chat request
+    (_complete_fields or _stream_fields).
+
+    When the centroids are confident their labels come first and the cheap
+    model writes summary/reply; if that fails (other than transiently) the
+    full analysis fills in whatever is still missing.
+    """
+    result = {}
+
+    # ---- cascade: centroid labels + cheap model when confident ----
+    labels = classify(embedding)
+    if labels:
+        for field, value in labels.items():
+            result[field] = value
+            yield field, value
+
+        try:
+            async for field, value in fields(
+                model=FAST_MODEL,
+                messages=_build_reply_messages(subject, body, labels),
+                temperature=0.2,
+                response_format=_REPLY_FORMAT,
+            ):
+                result[field] = value
+                yield field, value
+        except _TRANSIENT_ERRORS:
+            raise
+        except Exception as e:
+            print("Fast path failed, escalating:", e)
+
+        if _is_complete(result):
+            return
+
+    async for field, value in fields(
+        model=MODEL,
+        messages=_build_messages(subject, body),
+        temperature=0.2,
+        response_format=_RESPONSE_FORMAT,
+    ):
+        if field not in result:  # don't contradict what was already sent
+            result[field] = value
+            yield field, value
+
+
+@_cache.cached(_aembed, cacheable=_is_complete)
+async def analyze_ticket_async(subject: str, body: str, embedding=None) -> dict:
+    result = {}
+
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=messages,
-            temperature=0.2,
-            response_format={"type": "json_schema", "json_schema": schema},
-        )
-        content = resp.choices[0].message.content
-        return json.loads(content)
+        async for field, value in _cascade(subject, body, embedding, _complete_fields):
+            result[field] = value
+        return result
+    except _TRANSIENT_ERRORS:
+        # already retried in _create; a second model call would only add load
+        raise
     except Exception:
         # Fallback: JSON mode (valid JSON, λιγότερο strict)
-        resp = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                *messages,
-                {
-                    "role": "user",
-                    "content": "Return ONLY a valid JSON object with keys: priority, category, summary, suggested_reply.",
-                },
-            ],
+        resp = await _create(
+            model=MODEL,
+            messages=[*_build_messages(subject, body), _FALLBACK_INSTRUCTION],
             temperature=0.2,
             response_format={"type": "json_object"},
         )
+        _log_usage(resp)
         content = resp.choices[0].message.content
-        return json.loads(content)
+        return orjson.loads(content)
+
+
+# ---- streaming ----
+
+# A complete "key": "value" pair. Quotes inside JSON strings are always
+# escaped, so this can't match inside a value that is still being streamed.
+_FIELD_RE = re.compile(r'"(priority|category|summary|suggested_reply)"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+async def _stream_fields(**kwargs):
+    """
+    Stream one chat completion, yielding (field, value) pairs as each
+    field of the JSON answer completes.
+    """
+    stream = await _create(**kwargs, stream=True, stream_options={"include_usage": True})
+
+    buffer = ""
+    pos = 0
+    async for chunk in stream:
+        if chunk.usage is not None:
+            _log_usage(chunk)
+        if not chunk.choices:
+            continue
+
+        buffer += chunk.choices[0].delta.content or ""
+        for match in _FIELD_RE.finditer(buffer, pos):
+            yield match.group(1), orjson.loads(match.group(2))
+            pos = match.end()
+
+
+async def stream_analysis(subject: str, body: str):
+    """
+    Async generator of (field, value) pairs, each yielded as soon as the
+    field is ready (priority and category first). Goes through the same
+    cache and classifier cascade as analyze_ticket_async, and caches the
+    result once all fields have arrived.
+    """
+    key, vector, hit = await _cache.lookup(subject, body, _aembed)
+    if hit is not None:
+        for item in hit.items():
+            yield item
+        return
+
+    result = {}
+    async for field, value in _cascade(subject, body, vector, _stream_fields):
+        result[field] = value
+        yield field, value
+
+    if _is_complete(result):
+        await asyncio.to_thread(_cache.set, key, vector, result)
+
+
+# ---- bulk processing ----
+
+async def analyze_tickets_bulk(tickets: list[tuple[str, str]]) -> list:
+    """
+    Analyze many (subject, body) pairs concurrently. Concurrency is capped
+    across all bulk requests; rate limits/retries are handled by _create.
+    Returns one result per ticket, in order: the analysis dict or the exception.
+    """
 
+    async def process(subject: str, body: str) -> dict:
+        async with _bulk_semaphore:
+            return await analyze_ticket_async(subject, body)
 
+    return await asyncio.gather(
+        *(process(subject, body) for subject, body in tickets),
+        return_exceptions=True,
+    )
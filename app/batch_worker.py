@@ -0,0 +1,211 @@
+"""
+Backfills AI fields for non-live tickets via the OpenAI Batch API.
+
+Tickets from async intake sources (zapier, email) are stored without
+analysis. Every few minutes this worker checks the batches it already
+submitted (writing back results of finished ones) and submits one new
+batch for pending tickets that aren't in flight (half-price tokens, up
+to 24h turnaround).
+
+Submitted batches and their tickets are recorded in batch_jobs /
+batch_job_tickets, so a restart resumes polling instead of paying for
+the same tickets again.
+
+Run:
+python -m app.batch_worker
+"""
+
+import json
+import time
+
+from app.ai import build_chat_body, get_client
+from app.db import NOW_SQL, get_connection, init_db
+
+# Sources nobody is waiting on live; create_ticket skips sync analysis for them.
+BATCH_SOURCES = ("zapier", "email")
+
+BATCH_INTERVAL_SECONDS = 5 * 60
+# Batch API input limits are 50,000 requests and 200 MB per file. Each line
+# repeats the ~6 KB system prompt, so the byte cap is usually hit first.
+MAX_BATCH_SIZE = 50_000
+MAX_BATCH_BYTES = 190 * 1024 * 1024  # headroom under 200 MB
+MAX_BATCH_ATTEMPTS = 3   # per ticket; after that it's left for an agent
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def fetch_pending() -> list:
+    sources = ", ".join("?" for _ in BATCH_SOURCES)
+    terminal = ", ".join("?" for _ in TERMINAL_STATUSES)
+
+    with get_connection(readonly=True) as conn:
+        return conn.execute(
+            f"""
+            SELECT t.id, t.subject, t.body FROM tickets t
+            WHERE t.priority IS NULL
+              AND t.source IN ({sources})
+              AND NOT EXISTS (
+                  SELECT 1 FROM batch_job_tickets bt
+                  JOIN batch_jobs b ON b.id = bt.batch_id
+                  WHERE bt.ticket_id = t.id AND b.status NOT IN ({terminal})
+              )
+              AND (SELECT COUNT(*) FROM batch_job_tickets bt WHERE bt.ticket_id = t.id) < ?
+            ORDER BY t.id
+            LIMIT ?
+            """,
+            (*BATCH_SOURCES, *TERMINAL_STATUSES, MAX_BATCH_ATTEMPTS, MAX_BATCH_SIZE),
+        ).fetchall()
+
+
+def fetch_open_batches() -> list[str]:
+    terminal = ", ".join("?" for _ in TERMINAL_STATUSES)
+
+    with get_connection(readonly=True) as conn:
+        rows = conn.execute(
+            f"SELECT id FROM batch_jobs WHERE status NOT IN ({terminal}) ORDER BY created_at",
+            TERMINAL_STATUSES,
+        ).fetchall()
+    return [row["id"] for row in rows]
+
+
+def build_batch_file(rows) -> tuple[bytes, list]:
+    """
+    JSONL input for as many rows as fit in MAX_BATCH_BYTES.
+    Returns the file and the rows in it; the rest wait for the next tick.
+    """
+    lines = []
+    size = 0
+
+    for row in rows:
+        line = json.dumps({
+            "custom_id": str(row["id"]),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": build_chat_body(row["subject"], row["body"]),
+        }).encode() + b"\n"
+
+        if lines and size + len(line) > MAX_BATCH_BYTES:
+            break
+        lines.append(line)
+        size += len(line)
+
+    return b"".join(lines), rows[:len(lines)]
+
+
+def submit_batch(client, rows) -> str:
+    content, rows = build_batch_file(rows)
+    upload = client.files.create(
+        file=("tickets.jsonl", content),
+        purpose="batch",
+    )
+    batch = client.batches.create(
+        input_file_id=upload.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO batch_jobs (id, status) VALUES (?, ?)",
+            (batch.id, batch.status),
+        )
+        conn.executemany(
+            "INSERT INTO batch_job_tickets (batch_id, ticket_id) VALUES (?, ?)",
+            [(batch.id, row["id"]) for row in rows],
+        )
+
+    print(f"Submitted batch {batch.id} with {len(rows)} tickets")
+    return batch.id
+
+
+def parse_results(output: str) -> list[tuple]:
+    updates = []
+
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if response.get("status_code") != 200:
+            continue
+
+        try:
+            content = response["body"]["choices"][0]["message"]["content"]
+            ai_data = json.loads(content)
+        except (KeyError, IndexError, TypeError, ValueError):
+            continue
+
+        updates.append((
+            ai_data.get("priority"),
+            ai_data.get("category"),
+            ai_data.get("summary"),
+            ai_data.get("suggested_reply"),
+            int(result["custom_id"]),
+        ))
+
+    return updates
+
+
+def poll_batch(client, batch_id: str) -> int:
+    """
+    Refresh one submitted batch; write back its results once it's finished.
+    Returns the number of tickets backfilled.
+    """
+    batch = client.batches.retrieve(batch_id)
+
+    updates = []
+    if batch.status in TERMINAL_STATUSES and batch.output_file_id:
+        updates = parse_results(client.files.content(batch.output_file_id).text)
+
+    with get_connection() as conn:
+        # Don't overwrite fields an agent filled in while the batch was running.
+        conn.executemany(
+            f"""
+            UPDATE tickets
+            SET priority = ?, category = ?, summary = ?, suggested_reply = ?,
+                updated_at = {NOW_SQL}
+            WHERE id = ? AND priority IS NULL
+            """,
+            updates,
+        )
+        conn.execute(
+            "UPDATE batch_jobs SET status = ? WHERE id = ?",
+            (batch.status, batch_id),
+        )
+
+    if batch.status in TERMINAL_STATUSES:
+        print(f"Batch {batch_id} finished: {batch.status}, backfilled {len(updates)} tickets")
+    return len(updates)
+
+
+def run_once(client) -> int:
+    updated = 0
+    for batch_id in fetch_open_batches():
+        try:
+            updated += poll_batch(client, batch_id)
+        except Exception as e:
+            print(f"Batch {batch_id} poll ERROR:", e)
+
+    rows = fetch_pending()
+    if rows:
+        submit_batch(client, rows)
+
+    return updated
+
+
+def main() -> None:
+    init_db()
+    client = get_client()
+
+    print("Batch worker is running...")
+    while True:
+        try:
+            run_once(client)
+        except Exception as e:
+            print("Batch worker ERROR:", e)
+        time.sleep(BATCH_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
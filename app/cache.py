@@ -0,0 +1,218 @@
+"""
+Response cache for ticket analysis.
+
+Two levels:
+- L1: exact match on a hash of subject + body (in-memory LRU)
+- L2: semantic match on the ticket embedding (cosine distance)
+
+L2 entries are persisted in SQLite (analysis_cache table) so they
+survive restarts and are shared between processes.
+"""
+
+import asyncio
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app.db import get_connection
+
+
+def ticket_text(subject: str, body: str) -> str:
+    return f"{subject}\n{body}"
+
+
+def ticket_key(subject: str, body: str) -> str:
+    return hashlib.blake2b(ticket_text(subject, body).encode(), digest_size=16).hexdigest()
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """
+    Cache of analysis results keyed by ticket text and embedding.
+    """
+
+    def __init__(self, max_distance: float = 0.1, maxsize: int = 10_000):
+        self.max_distance = max_distance
+        self.maxsize = maxsize
+
+        self._lock = threading.Lock()       # guards the in-memory state, held briefly
+        self._load_lock = threading.Lock()  # one loader at a time
+        self._loaded = False
+        self._exact: OrderedDict[str, dict] = OrderedDict()
+
+        # L2 ring buffer: (maxsize, dim) unit vectors, allocated on first use
+        self._vectors: np.ndarray | None = None
+        self._results: list[dict | None] = [None] * maxsize
+        self._count = 0  # filled rows
+        self._next = 0   # row the next entry overwrites
+
+    # ---- lookups ----
+
+    def get_exact(self, key: str) -> dict | None:
+        with self._lock:
+            hit = self._exact.get(key)
+            if hit is not None:
+                self._exact.move_to_end(key)
+            return hit
+
+    def get_similar(self, vector: np.ndarray) -> dict | None:
+        """
+        Nearest cached result within max_distance (blocking: run off the event loop).
+        """
+        self.load()
+
+        with self._lock:
+            if not self._count or self._vectors.shape[1] != vector.shape[0]:
+                return None
+
+            similarities = self._vectors[:self._count] @ vector
+            best = int(np.argmax(similarities))
+            if 1.0 - float(similarities[best]) <= self.max_distance:
+                return self._results[best]
+
+        return None
+
+    async def lookup(self, subject: str, body: str, embed) -> tuple[str, np.ndarray | None, dict | None]:
+        """
+        Exact match first, then semantic. Returns (key, unit embedding or
+        None, hit or None); on a miss, key and embedding are what set() takes.
+        """
+        key = ticket_key(subject, body)
+        hit = self.get_exact(key)
+        if hit is not None:
+            return key, None, hit
+
+        vector = None
+        try:
+            vector = _unit(await embed(ticket_text(subject, body)))
+            hit = await asyncio.to_thread(self.get_similar, vector)
+        except Exception as e:
+            print("Cache lookup failed:", e)
+
+        return key, vector, hit
+
+    # ---- updates ----
+
+    def set(self, key: str, vector: np.ndarray | None, result: dict) -> None:
+        # load first, so persisted entries never overwrite newer ones
+        self.load()
+
+        with self._lock:
+            self._remember(key, vector, result)
+
+        if vector is None:
+            return
+
+        try:
+            with get_connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (key, embedding, result) VALUES (?, ?, ?)",
+                    (key, vector.tobytes(), json.dumps(result)),
+                )
+        except sqlite3.Error as e:
+            print("Cache write failed:", e)
+
+    def load(self) -> None:
+        """
+        Populate memory from the persisted entries (once per process).
+        The buffer is built without holding the state lock; it's swapped in at the end.
+        """
+        if self._loaded:
+            return
+
+        with self._load_lock:
+            if self._loaded:
+                return
+
+            with get_connection(readonly=True) as conn:
+                rows = conn.execute(
+                    "SELECT key, embedding, result FROM analysis_cache ORDER BY rowid DESC LIMIT ?",
+                    (self.maxsize,),
+                ).fetchall()
+            rows.reverse()  # oldest first, like the ring buffer
+
+            exact: OrderedDict[str, dict] = OrderedDict()
+            vectors = None
+            results: list[dict | None] = [None] * self.maxsize
+            count = 0
+
+            if rows:
+                dim = len(rows[-1]["embedding"]) // 4  # float32
+                vectors = np.zeros((self.maxsize, dim), dtype=np.float32)
+                for row in rows:
+                    result = json.loads(row["result"])
+                    exact[row["key"]] = result
+                    if len(row["embedding"]) == dim * 4:  # skip rows from another embedding model
+                        vectors[count] = np.frombuffer(row["embedding"], dtype=np.float32)
+                        results[count] = result
+                        count += 1
+
+            with self._lock:
+                exact.update(self._exact)
+                self._exact = exact
+                while len(self._exact) > self.maxsize:
+                    self._exact.popitem(last=False)
+
+                self._vectors = vectors
+                self._results = results
+                self._count = count
+                self._next = count % self.maxsize
+                self._loaded = True
+
+    def _remember(self, key: str, vector: np.ndarray | None, result: dict) -> None:
+        self._exact[key] = result
+        self._exact.move_to_end(key)
+        if len(self._exact) > self.maxsize:
+            self._exact.popitem(last=False)
+
+        if vector is None:
+            return
+
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            self._results = [None] * self.maxsize
+            self._count = 0
+            self._next = 0
+
+        self._vectors[self._next] = vector
+        self._results[self._next] = result
+        self._next = (self._next + 1) % self.maxsize
+        self._count = min(self._count + 1, self.maxsize)
+
+    # ---- decorator ----
+
+    def cached(self, embed, cacheable=None):
+        """
+        Put the cache in front of an async analyze function taking
+        (subject, body). `embed(text)` is async too. On a miss the function
+        also gets the unit-length ticket embedding (or None) as `embedding=`,
+        so it doesn't have to embed again. Embedding failures only disable
+        the L2 lookup for that call. If given, `cacheable(result)` decides
+        whether a result is stored; rejected results are still returned.
+        """
+
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(subject: str, body: str) -> dict:
+                key, vector, hit = await self.lookup(subject, body, embed)
+                if hit is not None:
+                    return hit
+
+                result = await func(subject, body, embedding=vector)
+                if cacheable is None or cacheable(result):
+                    await asyncio.to_thread(self.set, key, vector, result)
+                return result
+
+            return wrapper
+
+        return decorator
@@ -0,0 +1,117 @@
+"""
+Embedding-based priority/category classifier (first stage of the cascade).
+
+Each (priority, category) label has a centroid: the mean embedding of a
+few seed tickets. A ticket whose embedding is close enough to one
+centroid gets that label without an LLM call; everything else is
+escalated to the full analysis.
+
+Build the centroids (once, or after editing SEED_TICKETS):
+python -m app.classifier
+"""
+
+import threading
+
+import numpy as np
+
+from app.db import DATA_DIR
+
+CENTROIDS_PATH = DATA_DIR / "label_centroids.npy"
+
+PRIORITIES = ("low", "medium", "high")
+CATEGORIES = ("billing", "technical", "account", "other")
+
+# Row order of the centroids file
+LABELS = [(priority, category) for priority in PRIORITIES for category in CATEGORIES]
+
+# Small labeled seed set: (priority, category, subject + body)
+SEED_TICKETS = [
+    ("low", "billing", "Invoice address\nHow do I add my company VAT number to future invoices?"),
+    ("low", "billing", "Annual plan\nIs there a discount if we switch to yearly billing?"),
+    ("medium", "billing", "Refund request\nI forgot to cancel my trial and was charged. Can I get a refund?"),
+    ("medium", "billing", "Wrong invoice\nMy last invoice shows the wrong company name and amount."),
+    ("high", "billing", "Charged twice\nI was charged twice for my subscription this month."),
+    ("high", "billing", "Unexpected charge\nThere is a charge on my card I did not authorize, please stop it now."),
+    ("low", "technical", "Export question\nHow can I export my reports to CSV?"),
+    ("low", "technical", "Webhook setup\nWhere do I configure webhooks for new orders?"),
+    ("medium", "technical", "Slow dashboard\nThe dashboard takes almost a minute to load since yesterday."),
+    ("medium", "technical", "Integration error\nThe Slack integration stopped posting notifications."),
+    ("high", "technical", "Site down\nThe app returns 500 errors for all our users, production is down."),
+    ("high", "technical", "Data missing\nAll our customer records disappeared after the last update."),
+    ("low", "account", "Change email\nHow do I change the email address on my account?"),
+    ("low", "account", "Username\nCan I change my username?"),
+    ("medium", "account", "Password reset\nI'm not receiving the password reset email."),
+    ("medium", "account", "Two-factor\nI lost my phone and can't complete two-factor authentication."),
+    ("high", "account", "Account hacked\nSomeone logged into my account from another country and changed my password."),
+    ("high", "account", "Team locked out\nNobody in our company can log in since this morning."),
+    ("low", "other", "Feature request\nAny plans for a dark mode?"),
+    ("low", "other", "Feedback\nJust wanted to say the new design looks great!"),
+    ("medium", "other", "Partnership\nWe'd like to discuss a partnership before our launch next week."),
+    ("medium", "other", "Sales question\nWe need a quote for 200 seats by the end of the week."),
+    ("high", "other", "Legal notice\nOur lawyer will contact you today regarding the contract breach."),
+    ("high", "other", "Urgent complaint\nYour support agent shared my private data with another customer."),
+]
+
+_lock = threading.Lock()
+_centroids: np.ndarray | None = None
+_loaded = False
+
+
+def build_centroids(embed_many) -> np.ndarray:
+    """
+    Embed the seed set with `embed_many(texts) -> vectors` and save one
+    unit-length centroid per label to CENTROIDS_PATH.
+    """
+    vectors = np.asarray(embed_many([text for _, _, text in SEED_TICKETS]), dtype=np.float32)
+    centroids = np.zeros((len(LABELS), vectors.shape[1]), dtype=np.float32)
+
+    for row, label in enumerate(LABELS):
+        members = [i for i, (p, c, _) in enumerate(SEED_TICKETS) if (p, c) == label]
+        if members:
+            mean = vectors[members].mean(axis=0)
+            centroids[row] = mean / np.linalg.norm(mean)
+
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    np.save(CENTROIDS_PATH, centroids)
+    return centroids
+
+
+def _load_centroids() -> np.ndarray | None:
+    global _centroids, _loaded
+
+    with _lock:
+        if not _loaded:
+            _centroids = np.load(CENTROIDS_PATH) if CENTROIDS_PATH.exists() else None
+            _loaded = True
+    return _centroids
+
+
+def classify(embedding: np.ndarray | None, threshold: float = 0.8) -> dict | None:
+    """
+    Return {"priority", "category"} for a unit-length ticket embedding, or
+    None when no centroid is similar enough (or none have been built).
+    """
+    centroids = _load_centroids()
+    if embedding is None or centroids is None:
+        return None
+
+    similarities = centroids @ embedding
+    best = int(np.argmax(similarities))
+    if float(similarities[best]) <= threshold:
+        return None
+
+    priority, category = LABELS[best]
+    return {"priority": priority, "category": category}
+
+
+if __name__ == "__main__":
+    from app.ai import EMBEDDING_MODEL, get_client
+
+    client = get_client()
+
+    def embed_many(texts):
+        resp = client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+        return [item.embedding for item in resp.data]
+
+    build_centroids(embed_many)
+    print(f"Label centroids saved at: {CENTROIDS_PATH}")
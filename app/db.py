@@ -2,44 +2,161 @@
 Database module for Support Ticket Automation API.
 
 Handles:
-- SQLite connection
+- SQLite connection pools (1 writer, N readers)
 - Database initialization
-- Ticket table schema
+- Ticket table schema and indexes
+- Analysis cache table schema
+- Batch job tracking tables
 
 Safe to run multiple times (idempotent).
 """
 
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator
 
 # Project root → /data/tickets.db
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 DB_PATH = DATA_DIR / "tickets.db"
 
+# Ticket timestamps (created_at / updated_at), "YYYY-MM-DD HH:MM:SS.SSS".
+# Millisecond resolution, so two writes within the same second still give
+# the row a new updated_at (and a new ETag).
+NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Per-connection settings, applied on every open. journal_mode=WAL is
+# persistent (stored in the file header) and is set once by init_db.
+PRAGMAS = """
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-20000;
+PRAGMA busy_timeout=5000;
+PRAGMA foreign_keys=ON;
+"""
+
 
-def get_connection() -> sqlite3.Connection:
+def _connect(readonly: bool = False) -> sqlite3.Connection:
     """
-    Return SQLite connection with dict-like row access.
+    Open tuned SQLite connection with dict-like row access.
     Ensures /data folder exists.
     """
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
+    conn.executescript(PRAGMAS)
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
     conn.row_factory = sqlite3.Row
     return conn
 
 
+class ConnectionPool:
+    """
+    Fixed-size pool of pre-opened connections.
+    Keeps each connection's page cache warm between requests.
+    """
+
+    def __init__(self, size: int, readonly: bool = False):
+        self._pool: queue.Queue[sqlite3.Connection] = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._pool.put(_connect(readonly))
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# SQLite allows a single writer at a time, so writes share one connection
+# while reads fan out over one connection per core.
+_pools_lock = threading.Lock()
+_writer_pool: ConnectionPool | None = None
+_reader_pool: ConnectionPool | None = None
+
+
+def _get_pool(readonly: bool) -> ConnectionPool:
+    global _writer_pool, _reader_pool
+
+    with _pools_lock:
+        if _writer_pool is None:
+            _writer_pool = ConnectionPool(1)
+        if _reader_pool is None:
+            _reader_pool = ConnectionPool(os.cpu_count() or 4, readonly=True)
+
+    return _reader_pool if readonly else _writer_pool
+
+
+@contextmanager
+def get_connection(readonly: bool = False) -> Iterator[sqlite3.Connection]:
+    """
+    Borrow a pooled connection (writer by default, reader if readonly).
+
+    Writer connections run inside one explicit transaction. BEGIN IMMEDIATE
+    takes the write lock upfront instead of upgrading a deferred read lock
+    mid-transaction, which is what causes SQLITE_BUSY under concurrency.
+    """
+    with _get_pool(readonly).connection() as conn:
+        if readonly:
+            yield conn
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        finally:
+            # error in the block or in COMMIT itself: never hand back an open transaction
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+
+
+def close_pools() -> None:
+    """
+    Close every pooled connection (called on app shutdown).
+    """
+    global _writer_pool, _reader_pool
+
+    with _pools_lock:
+        for pool in (_writer_pool, _reader_pool):
+            if pool is not None:
+                pool.close_all()
+        _writer_pool = None
+        _reader_pool = None
+
+
 def init_db() -> None:
     """
     Create database schema if it doesn't exist.
+
+    Runs as one script on its own connection: journal_mode can't be
+    changed inside the pooled writer's transaction.
     """
 
-    with get_connection() as conn:
+    conn = _connect()
+    try:
+        conn.executescript(
+            f"""
+            -- WAL: readers run alongside the writer, commits are one WAL append
+            PRAGMA journal_mode=WAL;
 
-        # ---- tickets table ----
-        conn.execute(
-            """
+            BEGIN IMMEDIATE;
+
+            -- ---- tickets table ----
             CREATE TABLE IF NOT EXISTS tickets (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
 
@@ -57,25 +174,43 @@ def init_db() -> None:
                 summary TEXT,
                 suggested_reply TEXT,
 
-                created_at TEXT NOT NULL DEFAULT (datetime('now')),
-                updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+                created_at TEXT NOT NULL DEFAULT ({NOW_SQL}),
+                updated_at TEXT NOT NULL DEFAULT ({NOW_SQL})
             );
-            """
-        )
 
-        # ---- auto update timestamp trigger ----
-        conn.execute(
-            """
-            CREATE TRIGGER IF NOT EXISTS tickets_updated_at
-            AFTER UPDATE ON tickets
-            FOR EACH ROW
-            BEGIN
-                UPDATE tickets
-                SET updated_at = datetime('now')
-                WHERE id = OLD.id;
-            END;
+            -- ---- indexes for list_tickets (ORDER BY created_at DESC [WHERE status = ?]) ----
+            CREATE INDEX IF NOT EXISTS idx_tickets_created_at ON tickets(created_at DESC);
+            CREATE INDEX IF NOT EXISTS idx_tickets_status_created ON tickets(status, created_at DESC);
+
+            -- ---- AI analysis cache (see app/cache.py) ----
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                key TEXT PRIMARY KEY,
+                embedding BLOB NOT NULL,
+                result TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT (datetime('now'))
+            );
+
+            -- ---- OpenAI Batch API jobs and the tickets in each (see app/batch_worker.py) ----
+            CREATE TABLE IF NOT EXISTS batch_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT (datetime('now'))
+            );
+            CREATE TABLE IF NOT EXISTS batch_job_tickets (
+                batch_id TEXT NOT NULL REFERENCES batch_jobs(id),
+                ticket_id INTEGER NOT NULL REFERENCES tickets(id),
+                PRIMARY KEY (batch_id, ticket_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_batch_job_tickets_ticket ON batch_job_tickets(ticket_id);
+
+            -- ---- updated_at is set by each UPDATE; drop the old trigger that re-updated rows ----
+            DROP TRIGGER IF EXISTS tickets_updated_at;
+
+            COMMIT;
             """
         )
+    finally:
+        conn.close()
 
 
 if __name__ == "__main__":
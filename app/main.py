@@ -2,19 +2,26 @@
 FastAPI entrypoint for AI Support Ticket Automation.
 """
 
-from typing import List
-
-from fastapi import FastAPI, HTTPException, Query
-
-from app.ai import analyze_ticket
-from app.db import get_connection, init_db
-from app.models import TicketCreate, TicketOut, TicketUpdate
+import asyncio
+import functools
+import hashlib
+from typing import Annotated, List
+
+import orjson
+from fastapi import Body, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+
+from app.ai import analyze_ticket_async, analyze_tickets_bulk, stream_analysis
+from app.batch_worker import BATCH_SOURCES
+from app.db import NOW_SQL, close_pools, get_connection, init_db
+from app.models import TicketBody, TicketCreate, TicketOut, TicketSummary, TicketUpdate
 from app.rabbitmq_client import send_message
 
 
 app = FastAPI(
     title="AI Support Ticket Automation API",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=ORJSONResponse,
 )
 
 
@@ -23,6 +30,11 @@ def startup_event():
     init_db()
 
 
+@app.on_event("shutdown")
+def shutdown_event():
+    close_pools()
+
+
 @app.get("/")
 def health_check():
     return {
@@ -31,72 +43,230 @@ def health_check():
     }
 
 
-@app.post("/tickets", response_model=TicketOut)
-def create_ticket(ticket: TicketCreate):
-    print("create_ticket hit")
+MAX_BULK_TICKETS = 100
+
+# Timestamps are set here too: databases created before NOW_SQL keep the
+# old second-resolution column defaults
+INSERT_TICKET_SQL = f"""
+    INSERT INTO tickets (
+        source,
+        customer_name,
+        customer_email,
+        subject,
+        body,
+        priority,
+        category,
+        summary,
+        suggested_reply,
+        created_at,
+        updated_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, {NOW_SQL}, {NOW_SQL})
+"""
+
+
+def _ticket_params(ticket: TicketCreate, ai_data: dict) -> tuple:
+    return (
+        ticket.source,
+        ticket.customer_name,
+        ticket.customer_email,
+        ticket.subject,
+        ticket.body,
+        ai_data.get("priority"),
+        ai_data.get("category"),
+        ai_data.get("summary"),
+        ai_data.get("suggested_reply"),
+    )
+
+
+def _insert_ticket(ticket: TicketCreate, ai_data: dict) -> dict:
+    with get_connection() as conn:
+        row = conn.execute(
+            INSERT_TICKET_SQL + " RETURNING *",
+            _ticket_params(ticket, ai_data),
+        ).fetchone()
+
+    return dict(row)
+
+
+def _insert_tickets(tickets: list[TicketCreate], ai_results: list[dict]) -> list[dict]:
+    with get_connection() as conn:
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM tickets").fetchone()[0]
+
+        conn.executemany(
+            INSERT_TICKET_SQL,
+            [_ticket_params(t, ai_data) for t, ai_data in zip(tickets, ai_results)],
+        )
+
+        rows = conn.execute(
+            "SELECT * FROM tickets WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, len(tickets)),
+        ).fetchall()
+
+    return [dict(r) for r in rows]
+
+
+def _send_messages(rows: list[dict]) -> None:
+    for row in rows:
+        send_message({
+            "ticket_id": row["id"],
+            "subject": row["subject"],
+            "body": row["body"],
+            "email": row["customer_email"]
+        })
+
+
+def _save_analysis(ticket_id: int, ai_data: dict) -> None:
+    if not ai_data:
+        return
 
-    # ---- AI analysis ----
-    try:
-        ai_data = analyze_ticket(ticket.subject, ticket.body)
-    except Exception:
-        ai_data = {
-            "priority": None,
-            "category": None,
-            "summary": None,
-            "suggested_reply": None,
-        }
-
-    # ---- DB insert ----
     with get_connection() as conn:
-        cursor = conn.execute(
-            """
-            INSERT INTO tickets (
-                source,
-                customer_name,
-                customer_email,
-                subject,
-                body,
-                priority,
-                category,
-                summary,
-                suggested_reply
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        # Don't overwrite fields an agent filled in while the analysis was running.
+        conn.execute(
+            f"""
+            UPDATE tickets
+            SET priority = ?, category = ?, summary = ?, suggested_reply = ?,
+                updated_at = {NOW_SQL}
+            WHERE id = ? AND priority IS NULL
             """,
             (
-                ticket.source,
-                ticket.customer_name,
-                ticket.customer_email,
-                ticket.subject,
-                ticket.body,
                 ai_data.get("priority"),
                 ai_data.get("category"),
                 ai_data.get("summary"),
                 ai_data.get("suggested_reply"),
+                ticket_id,
             ),
         )
 
-        ticket_id = cursor.lastrowid
 
-        row = conn.execute(
-            "SELECT * FROM tickets WHERE id = ?",
-            (ticket_id,),
-        ).fetchone()
+@app.post("/tickets", response_model=TicketOut)
+async def create_ticket(ticket: TicketCreate):
+    print("create_ticket hit")
+
+    # ---- AI analysis (non-live sources are backfilled by app/batch_worker.py) ----
+    ai_data = {
+        "priority": None,
+        "category": None,
+        "summary": None,
+        "suggested_reply": None,
+    }
+    if ticket.source not in BATCH_SOURCES:
+        try:
+            ai_data = await analyze_ticket_async(ticket.subject, ticket.body)
+        except Exception:
+            pass
+
+    # ---- DB insert (blocking, off the event loop) ----
+    row = await asyncio.to_thread(_insert_ticket, ticket, ai_data)
 
     # 👇 ΕΔΩ είναι σωστά το RabbitMQ
-    send_message({
-        "ticket_id": ticket_id,
+    await asyncio.to_thread(send_message, {
+        "ticket_id": row["id"],
         "subject": ticket.subject,
         "body": ticket.body,
         "email": ticket.customer_email
     })
 
-    return dict(row)
+    return row
+
+
+@app.post("/tickets/bulk", response_model=List[TicketOut])
+async def create_tickets_bulk(
+    tickets: Annotated[List[TicketCreate], Body(max_length=MAX_BULK_TICKETS)],
+):
+    if not tickets:
+        return []
+
+    # ---- AI analysis, fanned out (non-live sources go to the batch worker) ----
+    live = [i for i, t in enumerate(tickets) if t.source not in BATCH_SOURCES]
+    results = await analyze_tickets_bulk([(tickets[i].subject, tickets[i].body) for i in live])
+
+    ai_results = [{} for _ in tickets]
+    for i, result in zip(live, results):
+        if isinstance(result, dict):
+            ai_results[i] = result
+
+    # ---- DB insert (one executemany, one transaction) ----
+    rows = await asyncio.to_thread(_insert_tickets, tickets, ai_results)
+
+    await asyncio.to_thread(_send_messages, rows)
+
+    return rows
+
+
+# Streamed analyses run detached from their response; keep a reference until done
+_stream_tasks: set[asyncio.Task] = set()
+
+
+async def _stream_and_save(ticket: TicketCreate, ticket_id: int, queue: asyncio.Queue) -> None:
+    """
+    Put NDJSON events on `queue` as fields arrive, save the analysis, then
+    finish with a complete (or error) event and None. Runs to the end
+    whether or not anyone is reading the queue.
+    """
+    ai_data = {}
+    try:
+        async for key, value in stream_analysis(ticket.subject, ticket.body):
+            ai_data[key] = value
+            queue.put_nowait({"event": "partial", key: value})
+    except Exception as e:
+        print("Streaming analysis failed:", e)
+
+    try:
+        await asyncio.to_thread(_save_analysis, ticket_id, ai_data)
+        queue.put_nowait({"event": "complete", "id": ticket_id, **ai_data})
+    except Exception as e:
+        print("Saving streamed analysis failed:", e)
+        queue.put_nowait({"event": "error", "id": ticket_id, "detail": "Analysis could not be saved"})
+    finally:
+        queue.put_nowait(None)
+
+
+@app.post("/tickets/stream")
+async def create_ticket_stream(ticket: TicketCreate):
+    """
+    Create a ticket and stream its AI analysis as NDJSON events:
+    created (stored row), partial (one per field as soon as it's ready),
+    complete (all fields, sent once they are saved) or error. The analysis
+    is saved even if the client disconnects mid-stream. Non-live sources
+    get created + complete only; app/batch_worker.py analyzes them.
+    """
+    row = await asyncio.to_thread(_insert_ticket, ticket, {})
+
+    await asyncio.to_thread(_send_messages, [row])
+
+    queue: asyncio.Queue = asyncio.Queue()
+    if ticket.source in BATCH_SOURCES:
+        queue.put_nowait({"event": "complete", "id": row["id"]})
+        queue.put_nowait(None)
+    else:
+        task = asyncio.create_task(_stream_and_save(ticket, row["id"], queue))
+        _stream_tasks.add(task)
+        task.add_done_callback(_stream_tasks.discard)
+
+    async def events():
+        yield orjson.dumps({"event": "created", "ticket": row}) + b"\n"
+
+        while (event := await queue.get()) is not None:
+            yield orjson.dumps(event) + b"\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+# Columns of TicketSummary: list responses never carry body/suggested_reply
+SUMMARY_COLUMNS = ", ".join(TicketSummary.model_fields)
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return etag in (tag.strip() for tag in if_none_match.split(","))
 
 
 @app.get("/tickets/{ticket_id}", response_model=TicketOut)
-def get_ticket(ticket_id: int):
-    with get_connection() as conn:
+def get_ticket(ticket_id: int, request: Request, response: Response):
+    with get_connection(readonly=True) as conn:
         row = conn.execute(
             "SELECT * FROM tickets WHERE id = ?",
             (ticket_id,),
@@ -105,59 +275,96 @@ def get_ticket(ticket_id: int):
     if not row:
         raise HTTPException(status_code=404, detail="Ticket not found")
 
-    return dict(row)
+    etag = f'W/"{row["id"]}-{row["updated_at"]}"'
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    # Rows come from our own schema: skip re-validating them on the read path
+    return TicketOut.model_construct(**dict(row))
+
+
+@app.get("/tickets/{ticket_id}/body", response_model=TicketBody)
+def get_ticket_body(ticket_id: int):
+    with get_connection(readonly=True) as conn:
+        row = conn.execute(
+            "SELECT id, body FROM tickets WHERE id = ?",
+            (ticket_id,),
+        ).fetchone()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+
+    return TicketBody.model_construct(**dict(row))
 
 
-@app.get("/tickets", response_model=List[TicketOut])
+@app.get("/tickets", response_model=List[TicketSummary])
 def list_tickets(
+    request: Request,
+    response: Response,
     status: str | None = None,
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
 ):
-    query = "SELECT * FROM tickets"
+    where = ""
     params: list = []
 
     if status:
-        query += " WHERE status = ?"
+        where = " WHERE status = ?"
         params.append(status)
 
-    query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
+    with get_connection(readonly=True) as conn:
+        rows = conn.execute(
+            f"SELECT {SUMMARY_COLUMNS} FROM tickets{where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        ).fetchall()
 
-    with get_connection() as conn:
-        rows = conn.execute(query, tuple(params)).fetchall()
+    # ---- ETag: pollers (Zapier) get a 304 when their page didn't change ----
+    # Built from the page itself (ids + updated_at), so no extra scan of the table
+    digest = hashlib.blake2b(f"{status}|{limit}|{offset}".encode(), digest_size=16)
+    for r in rows:
+        digest.update(f"|{r['id']}-{r['updated_at']}".encode())
 
-    return [dict(r) for r in rows]
+    etag = f'W/"{digest.hexdigest()}"'
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    return [TicketSummary.model_construct(**dict(r)) for r in rows]
+
+
+@functools.lru_cache(maxsize=64)
+def _build_update_sql(fields: frozenset) -> str:
+    """
+    UPDATE statement for one subset of TicketUpdate fields (at most 2^5).
+    Same subset -> same SQL text, so sqlite3's statement cache reuses it.
+    Columns are in sorted order; parameters must follow the same order.
+    """
+    updates = [f"{field} = ?" for field in sorted(fields)]
+
+    # No trigger: every UPDATE stamps updated_at itself
+    updates.append(f"updated_at = {NOW_SQL}")
+
+    return f"UPDATE tickets SET {', '.join(updates)} WHERE id = ? RETURNING *"
 
 
 @app.patch("/tickets/{ticket_id}", response_model=TicketOut)
 def update_ticket(ticket_id: int, patch: TicketUpdate):
-    updates = []
-    params = []
-
     data = patch.model_dump(exclude_unset=True)
-    for key, value in data.items():
-        updates.append(f"{key} = ?")
-        params.append(value)
 
-    if not updates:
+    if not data:
         raise HTTPException(status_code=400, detail="No fields provided")
 
+    params = [data[key] for key in sorted(data)]
     params.append(ticket_id)
 
     with get_connection() as conn:
-        cur = conn.execute(
-            f"UPDATE tickets SET {', '.join(updates)} WHERE id = ?",
-            tuple(params),
-        )
-
-        if cur.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Ticket not found")
-
         row = conn.execute(
-            "SELECT * FROM tickets WHERE id = ?",
-            (ticket_id,),
+            _build_update_sql(frozenset(data)),
+            tuple(params),
         ).fetchone()
 
-    return dict(row)
+    if not row:
+        raise HTTPException(status_code=404, detail="Ticket not found")
 
+    return dict(row)
@@ -16,21 +16,29 @@ class TicketCreate(BaseModel):
     body: str = Field(..., min_length=1)
 
 
-class TicketOut(BaseModel):
+class TicketSummary(BaseModel):
     id: int
     source: str
     customer_name: Optional[str] = None
     customer_email: Optional[EmailStr] = None
     subject: str
-    body: str
     status: str
     priority: Optional[str] = None
     category: Optional[str] = None
     summary: Optional[str] = None
-    suggested_reply: Optional[str] = None
     created_at: str
     updated_at: str
 
+
+class TicketOut(TicketSummary):
+    body: str
+    suggested_reply: Optional[str] = None
+
+
+class TicketBody(BaseModel):
+    id: int
+    body: str
+
 from typing import Literal
 
 class TicketUpdate(BaseModel):